@@ -13,6 +13,7 @@ Python Class for EPICS Digital I/O control.
 """
 
 from epics import PV
+from py4syn.utils.put import putMany
 
 class ErrorPortSequence(Exception):
     """
@@ -51,6 +52,16 @@ class ErrorInputAssignment(Exception):
         return str("Cannot assign a value to an INPUT port (read only).")
 
 
+class ErrorPutTimeout(Exception):
+    """
+    Exception raised when the ports do not confirm new values in time.
+    """
+    def __init__(self, port_indexes):
+        self.arg = port_indexes
+    def __str__(self):
+        return str("Ports " + str(self.arg) + " did not complete the put in time.")
+
+
 class DigitalIO(object):
     """
     Class for Digital I/O using EPICS.
@@ -161,6 +172,45 @@ class DigitalIO(object):
         else:
             raise ErrorInputAssignment()
 
+    def putValues(self, port_indexes, new_values, wait=False, timeout=30):
+        """
+        Set new values for several port PVs at once.
+
+        Parameters
+        ----------
+        port_indexes : `list`
+            Indexes of the ports.
+
+        new_values : `list`
+            New values of the port PVs, in the same order of the indexes.
+
+        wait : `bool`
+            Wait until all ports complete the put. All puts are sent before
+            waiting, so they are completed together.
+
+        timeout : `float`
+            Maximum time (seconds) to wait the puts.
+        """
+
+        if self.port_type != 'OUTPUT':
+            raise ErrorInputAssignment()
+
+        # All ports are checked before any value is written
+        port_pvs = []
+        for port_index in port_indexes:
+            port_index = int(port_index)
+
+            if port_index not in self.port_pv_dict:
+                raise ErrorIndexNotFound(port_index)
+
+            port_pvs.append(self.port_pv_dict[port_index])
+
+        if not wait:
+            for port_pv, new_value in zip(port_pvs, new_values):
+                port_pv.put(new_value)
+        elif not putMany(port_pvs, new_values, timeout):
+            raise ErrorPutTimeout([int(p) for p in port_indexes])
+
     def list(self):
         """
         Lists name of all ports in use.
@@ -17,23 +17,20 @@ import numpy as np
 from threading import Event
 import h5py
 from py4syn.utils.timer import Timer
-from py4syn.epics.ImageHDFClass import ImageHDF
-
-# constants used to parse PV name
-CHANNELPOSITION=3
-ROIPOSITION=6
+from py4syn.utils.put import putMany
+from py4syn.epics.ImageHDFClass import ImageHDF, IMAGEMEMORY, parseChannel
 
 class Dxp(ImageHDF):
 
     # CONSTRUCTOR OF DXP CLASS
     def __init__(self, mnemonic, numberOfChannels=4, numberOfRois=32,
                  pv=None, dxpType="mca", responseTimeout=15, output="./out",
-                 numPoints=2048):
+                 numPoints=2048, imageMemory=IMAGEMEMORY):
         """ Constructor
         responseTimeout : how much time to wait dxp answer
         imageDeep : how many points are collected each time
         """
-        super().__init__(mnemonic, numPoints, output, dxpType)
+        super().__init__(mnemonic, numPoints, output, dxpType, imageMemory)
 
         self.dxpType = dxpType
         self.acquireChanged = Event()
@@ -77,6 +74,10 @@ class Dxp(ImageHDF):
         self.responseTimeout = responseTimeout
         self.timer = Timer(self.responseTimeout)
 
+        # spectra are always copied to this buffer, avoiding to allocate
+        # a new array on each point
+        self.spectrumBuffer = np.empty(self.numPoints, dtype=np.int32)
+
     def statusChange(self, value, **kw):
         """
         Helper callback used to wait for the end of the acquisition.
@@ -98,8 +99,10 @@ class Dxp(ImageHDF):
         -------
         out : None
         """
-        for i in range(0, self.channels):
-            self.pvDxpAcquireTime[i].put(time, wait=True)
+        # all channels are set at once and waited with a single deadline
+        if not putMany(self.pvDxpAcquireTime, [time]*self.channels,
+                       self.responseTimeout):
+            raise RuntimeError('DXP is not answering')
 
         # This make long exposure time works
         if (self.responseTimeout < time*0.4):
@@ -129,10 +132,8 @@ class Dxp(ImageHDF):
         """Return intensity
         channel is on format mcaC.Rr, where C is  the channel and
         r is the ROI"""
-        channel = kwargs['channel']
-        c = int(channel[CHANNELPOSITION]) - 1
-        if(len(channel) > ROIPOSITION):
-            r = int(channel[ROIPOSITION])
+        c, r = parseChannel(kwargs['channel'])
+        if r is not None:
             return self.pvDxpRois[c][r].get()
         else:
             self.saveSpectrum(c, **kwargs)
@@ -143,14 +144,18 @@ class Dxp(ImageHDF):
         This method load spectrum from a PV and then save it to HDF file'''
         self.pvDxpPresetMode.put("Live time")
         self.ch = ch
-        self.spectrum = self.pvDxpChannels[self.ch].get(as_numpy=True)
-
-        if self.image is None:
-            # if is a point, prefix is different
-            self.prefix = self.dxpType + str(self.ch)
+        spectrum = self.pvDxpChannels[self.ch].get(as_numpy=True,
+                                                   count=self.numPoints,
+                                                   use_monitor=True)
+        np.copyto(self.spectrumBuffer, spectrum)
+        self.spectrum = self.spectrumBuffer
 
         super().saveSpectrum()
 
+    def pointPrefix(self):
+        """Points of each channel are saved on their own files"""
+        return self.dxpType + str(self.ch)
+
     def isCountRunning(self):
         return (self.pvDxpAcquire.get())
 
@@ -200,11 +205,22 @@ class Dxp(ImageHDF):
         if self.acquiring:
             raise RuntimeError('Already counting')
 
+        self.preparePointNames()
+
         self.acquiring = True
         self.pvDxpEraseStart.put(1)
         # resets initial time value
         self.timer.mark()
 
+    def preparePointNames(self):
+        """Search the names of the mca files before the acquisition"""
+        if self.image is None:
+            prefixes = []
+            for c in range(self.channels):
+                prefixes.append(self.dxpType + str(c))
+                prefixes.append(self.dxpType + str(c) + '_norm')
+            self.prepareNames(prefixes, self.pointSuffix())
+
     def stopCount(self):
         self.setCountStop()
 
@@ -216,16 +232,12 @@ class Dxp(ImageHDF):
         """Stops an ongoing acquisition, if any, and puts the EPICS IOC in
         idle state."""
         self.pvDxpStop.put(1, wait=True)
+        self.closeImage()
+        self.savePoints()
+        self.saveIndexes()
 
     def startCollectImage(self, rows=0, cols=0):
         """Start to collect an image
         When collect an image, the points will be  saved on a hdf file"""
-        super().startCollectImage("int32", rows, cols)
-
-    def setNormValue(self, value):
-        """Applies normalization"""
-        if self.image is None:
-            self.prefix = self.dxpType + str(self.ch)
-
-        super().setNormValue(value)
+        super().startCollectImage("int32", rows, cols, self.channels)
 
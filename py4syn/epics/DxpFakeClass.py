@@ -12,23 +12,26 @@ import os
 
 import numpy as np
 import h5py
-from py4syn.epics.ImageHDFClass import ImageHDF
+from py4syn.epics.ImageHDFClass import ImageHDF, IMAGEMEMORY, parseChannel
 
 NUMPOINTS = 2048
-# constants used to parse PV name
-CHANNELPOSITION=3
-ROIPOSITION=6
+# maximum number of spectra generated in advance for an image
+POOLSIZE = 1024
 
 class DxpFake(ImageHDF):
     # CONSTRUCTOR OF DXP CLASS
     def __init__(self, mnemonic, numberOfChannels=4, numberOfRois=32,
-                 pv=None, dxpType="mca", responseTimeout=15, output="out"):
+                 pv=None, dxpType="mca", responseTimeout=15, output="out",
+                 imageMemory=IMAGEMEMORY):
         """ Constructor
         responseTimeout : how much time to wait dxp answer
         """
-        super().__init__(mnemonic, NUMPOINTS, output, dxpType)
+        super().__init__(mnemonic, NUMPOINTS, output, dxpType, imageMemory)
         self.acquiring = False
+        self.channels = numberOfChannels
         self.rois = numberOfRois
+        self.rng = np.random.default_rng()
+        self.pool = None
 
     def statusChange(self, value, **kw):
         """
@@ -55,7 +58,7 @@ class DxpFake(ImageHDF):
         pass
 
     def getRealTime(self):
-        return np.random.rand()
+        return self.rng.random()
 
     def setCountStop(self):
         pass
@@ -64,17 +67,22 @@ class DxpFake(ImageHDF):
         """Return intensity
         channel is on format mcaC.Rr, where C is  the channel and
         r is the ROI"""
-        channel = kwargs['channel']
-        c = int(channel[CHANNELPOSITION]) - 1
-        if(len(channel) > ROIPOSITION):
-            return np.random.rand()
+        c, r = parseChannel(kwargs['channel'])
+        if r is not None:
+            return self.rng.random()
         else:
             self.saveSpectrum(c, **kwargs)
             return 1.0
 
     def saveSpectrum(self, ch, **kwargs):
-        self.spectrum = np.random.randint(100, size=(2048))
         self.ch = ch
+        if self.image is None:
+            self.spectrum = self.rng.integers(100, size=NUMPOINTS,
+                                             dtype=np.int32)
+        else:
+            # images use the spectra generated on startCollectImage
+            pos = self.channelPos[self.imageChannel()] % len(self.pool)
+            self.spectrum = self.pool[pos]
 
         super().saveSpectrum()
 
@@ -111,7 +119,13 @@ class DxpFake(ImageHDF):
         pass
 
     def startCount(self):
-        pass
+        self.preparePointNames()
+
+    def preparePointNames(self):
+        """Search the names of the mca files before the acquisition"""
+        if self.image is None:
+            self.prepareNames([self.prefix, self.prefix + '_norm'],
+                              self.pointSuffix())
 
     def stopCount(self):
         pass
@@ -121,9 +135,14 @@ class DxpFake(ImageHDF):
         pass
 
     def close(self):
-        pass
+        self.closeImage()
+        self.savePoints()
+        self.saveIndexes()
 
     def startCollectImage(self, rows=0, cols=0):
         """Start to collect an image
         When collect an image, the points will be  saved on a hdf file"""
-        super().startCollectImage("int32", rows, cols)
+        super().startCollectImage("int32", rows, cols, self.channels)
+        poolSize = max(1, min(rows*cols, POOLSIZE))
+        self.pool = self.rng.integers(100, size=(poolSize, NUMPOINTS),
+                                      dtype=np.int32)
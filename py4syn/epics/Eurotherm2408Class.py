@@ -11,7 +11,7 @@ Python class for Eurotherm 2408 temperature controllers
 import time
 from threading import Event
 
-from epics import Device, ca
+from epics import Device
 from py4syn.epics.IScannable import IScannable
 from py4syn.epics.StandardDevice import StandardDevice
 
@@ -37,13 +37,41 @@ class Eurotherm2408(StandardDevice, IScannable):
         super().__init__(mnemonic)
 
         self.device = Device(pvName + ':', ['PV:RBV', 'SP','RR', 'RR:RBV',
-        'WSP:RBV', 'O' , 'O:RBV', 'MAN'])
+        'WSP:RBV', 'O' , 'O:RBV', 'MAN', 'P', 'I', 'D'])
 
         self.newTemp = Event()
         self.pvName = pvName
 
+        # set point, target and temperature are kept updated by monitors
+        self.sp = None
+        self.target = None
+        self.temperature = None
+        self.device.add_callback('SP', self.onSPChange)
+        self.device.add_callback('WSP:RBV', self.onTargetChange)
+        self.device.add_callback('PV:RBV', self.onTempChange)
 
 
+
+    def onSPChange(self, value, **kw):
+        """
+        Helper callback used to store the last Set Point.
+        """
+        self.sp = value
+
+    def onTargetChange(self, value, **kw):
+        """
+        Helper callback used to store the last target temperature.
+        """
+        self.target = value
+
+    def onTempChange(self, value, **kw):
+        """
+        Helper callback used to store the last temperature and to wake up
+        threads waiting for it.
+        """
+        self.temperature = value
+        self.newTemp.set()
+
     def getValue(self):
         """
         Returns the current measured temperature.
@@ -63,8 +91,9 @@ class Eurotherm2408(StandardDevice, IScannable):
         -------
         `float
         """
-        time.sleep(0.5)
-        return self.device.get('SP')
+        if self.sp is None:
+            self.sp = self.device.get('SP')
+        return self.sp
 
 
     def getTarget(self):
@@ -75,8 +104,9 @@ class Eurotherm2408(StandardDevice, IScannable):
         -------
         `float`
         """
-        time.sleep(0.5)
-        return self.device.get('WSP:RBV')
+        if self.target is None:
+            self.target = self.device.get('WSP:RBV')
+        return self.target
 
     def getRealPosition(self):
         """
@@ -143,6 +173,7 @@ class Eurotherm2408(StandardDevice, IScannable):
         if value < self.getLowLimitValue() or value > self.getHighLimitValue():
             raise ValueError('Value exceeds limits')
         self.device.put('SP', value)
+        self.sp = value
         if wait:
             self.wait()
 
@@ -213,8 +244,12 @@ class Eurotherm2408(StandardDevice, IScannable):
 
 
     def reachTemp(self):
-        if self.getValue() < self.getSP() + DELTA and \
-          self.getValue() > self.getSP() - DELTA:
+        if self.temperature is None:
+            self.temperature = self.getValue()
+
+        sp = self.getSP()
+        if self.temperature < sp + DELTA and \
+          self.temperature > sp - DELTA:
           return True
         return False
 
@@ -224,9 +259,11 @@ class Eurotherm2408(StandardDevice, IScannable):
         Blocks until the requested temperature is achieved.
         """
         self.newTemp.clear()
+        # each new temperature wakes up the loop
         while not self.reachTemp():
-            ca.flush_io()
-            self.newTemp.wait(5)
+            # without updates, read the temperature again
+            if not self.newTemp.wait(5):
+                self.temperature = self.getValue()
             self.newTemp.clear()
 
     def setVelocity(self, velo):
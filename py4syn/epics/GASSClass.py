@@ -9,21 +9,25 @@ Python class for GAs Selection System (GASS) device
 .. moduleauthor:: Douglas Bezerra Beniz <douglas.beniz@lnls.br>
 
 """
-import socket
+import logging
 import numpy
+import re
 
-from threading import Thread
-from queue import Queue
-from time import sleep
+from threading import Event, Lock
+from time import sleep, monotonic
 from enum import Enum
+from functools import lru_cache
+from contextlib import contextmanager
 
-from py4syn.epics.DigitalIOClass        import DigitalIO
-from py4syn.epics.BlueRibbonBD306Class  import BlueRibbonBD306
+# Messages of the procedures, only formatted when DEBUG is enabled
+log = logging.getLogger(__name__)
 
 # -----------------------------------------------------------
 # Global constants
 # -----------------------------------------------------------
 MAXIMUM_TIMEOUT = 30        # seconds
+FINE_TUNING_WAIT = 1        # seconds, between checks when fine tuning pressures
+VALVE_TOGGLE_TIME = 0.02    # seconds, a chamber valve stays open when toggled
 
 # -----------------------------------------------------------
 # Valves
@@ -44,6 +48,13 @@ class Valves(Enum):
     I1 = 5
     I2 = 6
 
+# Values of the valves, to avoid enum lookups on each operation
+_VACUUM, _N2, _HE, _AR, _I0, _I1, _I2 = (valve.value for valve in Valves)
+
+# Valve slice of the chambers (I0, I1 and I2) and their indexes
+_CHAMBER_SLICE = slice(_I0, _I2 + 1)
+_CHAMBERS = range(_I2 - _I0 + 1)
+
 # -----------------------------------------------------------
 # Pressures
 # -----------------------------------------------------------
@@ -163,8 +174,8 @@ GAS_PROPORTIONS  = {'Ac':{  'L1':[[0,0,100],[0,0,100],[0,0,100]],
                             'L2':[[96,0,4],[70,0,30],[70,0,30]],
                             'L3':[[98,0,2],[78,0,22],[78,0,22]]},
                     'Te':{  'L1':[[45,55,0],[95,0,5],[95,0,5]],
-                            'L3':[[16,84,0],[53,48,0],[53,48,0]],
-                            'L3':[[40,60,0],[100,0,0],[100,0,0]]},
+                            'L2':[[40,60,0],[100,0,0],[100,0,0]],
+                            'L3':[[16,84,0],[53,48,0],[53,48,0]]},
                     'Th':{  'L3':[[42,0,58],[0,0,100],[0,0,100]]},
                     'Ti':{  'K': [[45,55,0],[95,0,5],[95,0,5]]},
                     'Tl':{  'L1':[[58,0,42],[0,0,100],[0,0,100]],              # douglas.beniz - to be confirmed!
@@ -187,6 +198,101 @@ GAS_PROPORTIONS  = {'Ac':{  'L1':[[0,0,100],[0,0,100],[0,0,100]],
                     'Zn':{  'K': [[90,0,10],[50,0,50],[50,0,50]]},
                     'Zr':{  'K': [[21,0,79],[0,0,100],[0,0,100]]}}
 
+
+def _packGasProportions(gas_proportions):
+    """
+    Pack a table of gas proportions on a contiguous array.
+
+    Returns
+    ----------
+    table : `numpy.ndarray`
+        Proportions (%) of each element and edge as uint8, shaped (pairs, chambers, gases).
+    fractions : `numpy.ndarray`
+        Same proportions, already divided by 100 (float64, as pressures).
+    index : `dict`
+        Row of the table of each (element, edge) pair.
+    """
+    pairs = [(element, edge) for element, edges in gas_proportions.items() for edge in edges]
+    table = numpy.array([gas_proportions[element][edge] for element, edge in pairs])
+
+    # Each pair must give integer percentages of 3 gases for 3 chambers,
+    # summing 100 up to rounding
+    if ((table.ndim != 3) or (table.shape[1:] != (3, 3)) or (table.dtype.kind not in "iu")):
+        raise ValueError("Gas proportions must be 3x3 integer percentages per element and edge!")
+
+    sums = table.sum(axis=2)
+    if ((table.min() < 0) or (table.max() > 100) or (sums.min() < 99) or (sums.max() > 101)):
+        raise ValueError("Gas proportions must be percentages summing 100 on each chamber!")
+
+    table = table.astype(numpy.uint8)
+
+    return table, table * 0.01, {pair: row for row, pair in enumerate(pairs)}
+
+
+@lru_cache(maxsize=None)
+def _defaultGasTable():
+    """
+    Default table of gas proportions, packed on first use only.
+    """
+    table, fractions, index = _packGasProportions(GAS_PROPORTIONS)
+    # Shared by all instances using the default table
+    table.flags.writeable = False
+    fractions.flags.writeable = False
+
+    return table, fractions, index
+
+
+def _computeTargets(updatedPressures, deltaPressures, gasProportions, targetPressures):
+    """
+    targetPressure = P1 + (Proportion * DeltaPressure), with proportions as fractions.
+    """
+    numpy.multiply(gasProportions, deltaPressures, out=targetPressures)
+    numpy.add(targetPressures, updatedPressures, out=targetPressures)
+
+    return targetPressures
+
+
+def _crossingMask(pressures, targetPressures, done, greaterThan, mask):
+    """
+    Chambers not done yet whose pressure crossed the target (NaN never crosses).
+    """
+    if (greaterThan):
+        numpy.greater_equal(pressures, targetPressures, out=mask)
+    else:
+        numpy.less_equal(pressures, targetPressures, out=mask)
+
+    # For booleans, mask > done is mask and not done
+    numpy.greater(mask, done, out=mask)
+
+    return mask
+
+
+# One port ("8") or a range of ports ("2-6") of a sequence like "2-6;8"
+_PORTRANGE = re.compile(r'^\s*(\d+)(?:\s*-\s*(\d+))?\s*$')
+
+
+@lru_cache(maxsize=32)
+def _parsePortNumbers(port_sequences):
+    """
+    Parse a sequence of ports like "2-6;8", each sequence is parsed only once.
+
+    Returns
+    ----------
+    port_sequence_array : `tuple`
+        All port numbers.
+    """
+    port_sequence_array = []
+
+    for p in port_sequences.split(';'):
+        match = _PORTRANGE.match(p)
+        if (match is None):
+            raise ValueError("Invalid port sequence: %r" % p)
+
+        first, last = match.groups()
+        port_sequence_array.extend(range(int(first), int(last or first) + 1))
+
+    return tuple(port_sequence_array)
+
 # -----------------------------------------------------------------------------
 # Main class
 # -----------------------------------------------------------------------------
@@ -224,21 +330,48 @@ class GASS():
             Sequence to IO ports that that open/close valves of Vacuum, N2, He, Ar, I0, I1 and I2 in this ordering; You can use this syntax: "2-6;8"
         """
 
+        # EPICS devices are imported only when a GASS is created, so the
+        # table of gas proportions can be used without them
+        from py4syn.epics.DigitalIOClass        import DigitalIO
+        from py4syn.epics.BlueRibbonBD306Class  import BlueRibbonBD306
+
         # ----------------------------------------------------------------
         # Digital outputs to control valves of gases
         # ----------------------------------------------------------------
         self.valvesDigitalIO = DigitalIO(pvValvesDigitalPrefix, "OUTPUT", pvValvesDigitalPorts)
-        self.valvesArray = self.__getPortNumbers(pvValvesDigitalPorts)
+        self.valvesArray = numpy.array(self.__getPortNumbers(pvValvesDigitalPorts), dtype=numpy.int32)
 
         if (len(self.valvesArray) != len(Valves)):
             raise Exception("Inconsistent number of valves!")
 
+        # Ports of each valve, resolved once instead of on each operation;
+        # kept as plain ints, as expected by DigitalIO
+        ports = self.valvesArray.tolist()
+        self._allPorts = tuple(ports)
+        self._vacuumPort = ports[_VACUUM]
+        self._gasPorts = {Valves.N2: ports[_N2], Valves.He: ports[_HE], Valves.Ar: ports[_AR]}
+        self._chamberPorts = tuple(ports[_CHAMBER_SLICE])
+
+        # Last value written on each valve (None when unknown); the cache
+        # and the writes are only done holding the lock
+        self._valveState = dict.fromkeys(self._allPorts)
+        self._valveLock = Lock()
+
         # ----------------------------------------------------------------
         # Bulldog controllers to monitor pressure on ionization chambers
         # ----------------------------------------------------------------
         self.pressureI0 = BlueRibbonBD306(pvPressureI0Prefix, pvPressureI0Mnemonic)
         self.pressureI1_I2 = BlueRibbonBD306(pvPressureI1_I2Prefix, pvPressureI1_I2Mnemonic)
 
+        # Last pressure of each chamber, updated by monitors; waits are
+        # woken up when a pressure changes instead of polling the PVs
+        self._pressures = [None] *3
+        self._pressureGetters = (self.pressureI0.getPressure1, self.pressureI1_I2.getPressure1, self.pressureI1_I2.getPressure2)
+        self._pressureChanged = Event()
+        pressurePVs = (self.pressureI0.pvP1, self.pressureI1_I2.pvP1, self.pressureI1_I2.pvP2)
+        for chamberNumber, pv in enumerate(pressurePVs):
+            pv.add_callback(self.__onPressureChange, chamberNumber=chamberNumber)
+
         # Attributes to store element and edge
         self.element = element.title()
         self.edge = edge.title()
@@ -252,46 +385,56 @@ class GASS():
         self.extraTimeManifoldVacuum = extraTimeManifoldVacuum
 
         # Attribute to store if all target (chamber) pressures were reached
-        self.reachedPressure = numpy.array([False] *3)
-        self.enclosureQueue = Queue()
+        self.reachedPressure = numpy.zeros(3, dtype=numpy.bool_)
+
+        # Buffers of the pressure waits: last pressures, closed and crossed chambers
+        self._monitoredPressures = numpy.empty(3)
+        self._closedChambers = numpy.zeros(3, dtype=numpy.bool_)
+        self._crossedChambers = numpy.empty(3, dtype=numpy.bool_)
 
-        # Check if informed sequence is consistent
-        gasesOrder = [argonOrder, heliumOrder, nitrogenOrder]
-        gasesOrderConsistent = True
+        # Buffers of chamber and target pressures, reused on each fill
+        self._chambersPressures = numpy.zeros(3)
+        self._targetPressures = numpy.empty(3)
+        self._allTargetPressures = numpy.empty(3)
 
         self.set_gas_proportions(GAS_PROPORTIONS)
 
-        try:
-            for i in range(len(gasesOrder)):
-                gasesOrderConsistent &= (gasesOrder.index(i) > -1)
-        except ValueError:
-            gasesOrderConsistent = False
+        # Check element and edge once, before any operation
+        if (self._gasRow is None):
+            raise Exception("Element and/or edge is not in table!")
 
-        if (gasesOrderConsistent):
+        # Check if informed sequence is consistent: each position used once
+        gasesOrder = (argonOrder, heliumOrder, nitrogenOrder)
+
+        if (sorted(gasesOrder) == [0, 1, 2]):
             # Just to initiate the array...
-            self.gases = [0, 0, 0]
+            gases = [None] *3
+
+            # Order of gases to fill up the chambers
+            gases[argonOrder]    = Valves.Ar
+            gases[heliumOrder]   = Valves.He
+            gases[nitrogenOrder] = Valves.N2
 
-            # Order of gases to fill up the chambers           
-            self.gases[argonOrder]    = Valves.Ar
-            self.gases[heliumOrder]   = Valves.He
-            self.gases[nitrogenOrder] = Valves.N2
+            self.gases = tuple(gases)
         else:
             # --------------------------------------------------
             # 'Ar', 'He' and 'N2' in sequence (default)...
             # --------------------------------------------------
-            self.gases = [Valves.Ar, Valves.He, Valves.N2]
+            self.gases = (Valves.Ar, Valves.He, Valves.N2)
 
     # -------------------------------------------------------------------------
     # Get/Set attributes
     # -------------------------------------------------------------------------
     def set_element(self, element):
         self.element = element.title()
+        self.__updateGasRow()
 
     def get_element(self):
-        return self.element.title()
+        return self.element
 
     def set_edge(self, edge):
-        self.edge = edge
+        self.edge = edge.title()
+        self.__updateGasRow()
 
     def get_edge(self):
         return self.edge
@@ -323,72 +466,82 @@ class GASS():
     def set_gas_proportions(self, gas_proportions):
         self.gas_proportions = gas_proportions
 
+        # Default table is packed only once
+        if (gas_proportions is GAS_PROPORTIONS):
+            self._gasTable, self._gasFractions, self._gasIndex = _defaultGasTable()
+        else:
+            self._gasTable, self._gasFractions, self._gasIndex = _packGasProportions(gas_proportions)
+
+        self.__updateGasRow()
+
     def get_gas_proportions(self):
         return self.gas_proportions
 
+    def __updateGasRow(self):
+        # Row of current element and edge on table of gas proportions;
+        # None while the pair is not in table, as when element and edge
+        # are being changed one at a time
+        self._gasRow = self._gasIndex.get((self.element, self.edge))
+
+        # Fractions of current row, one contiguous line of chambers per gas
+        if (self._gasRow is None):
+            self._proportionMatrix = None
+        else:
+            self._proportionMatrix = numpy.ascontiguousarray(self._gasFractions[self._gasRow].T)
+
     # -------------------------------------------------------------------------
     # Valves control
     # -------------------------------------------------------------------------
+    def __setValve(self, io_port, value, force=False):
+        with self._valveLock:
+            # Valve already on this state, nothing to write
+            if (not force and self._valveState.get(io_port) == value):
+                return
+
+            # State is unknown until the write succeeds
+            self._valveState[io_port] = None
+            self.valvesDigitalIO.putValue(io_port, value)
+            self._valveState[io_port] = value
+
+
+    def __setValves(self, io_ports, value, force=False):
+        with self._valveLock:
+            # Only valves not already on this state, with a single call
+            if (force):
+                ports = list(io_ports)
+            else:
+                ports = [p for p in io_ports if self._valveState[p] != value]
+
+            self._valveState.update(dict.fromkeys(ports))
+            self.valvesDigitalIO.putValues(ports, (value,) *len(ports), wait=True)
+            self._valveState.update(dict.fromkeys(ports, value))
+
+
     def open_valve(self, io_port):
-        try:
-            self.valvesDigitalIO.putValue(io_port, 1)
-        except:
-            raise Exception("Error to open valve at I/O: %d" % str(io_port))
+        self.__setValve(io_port, 1)
 
 
     def open_all_valves(self):
-        io_port = -1
-
-        try:
-            for valve in Valves:
-                io_port = self.valvesArray[valve.value]
-                # Open
-                self.open_valve(io_port)
-        except:
-            raise Exception("Error to open valve at I/O: %d" % str(io_port))
+        self.__setValves(self._allPorts, 1)
 
 
     def open_all_chambers(self):
-        io_port = -1
-
-        try:
-            for i in range(Valves.I0.value, Valves.I2.value +1):
-                io_port = self.valvesArray[i]
-                # Open
-                self.open_valve(io_port)
-        except:
-            raise Exception("Error to open chamber's valve, I/O: %d" % str(io_port))
+        self.__setValves(self._chamberPorts, 1)
 
 
+    # Closing is the safe state, so closes are always written, even on
+    # valves the cache reports as closed
     def close_valve(self, io_port):
-        try:
-            self.valvesDigitalIO.putValue(io_port, 0)
-        except:
-            raise Exception("Error to close valve at I/O: %d" % str(io_port))
+        self.__setValve(io_port, 0, force=True)
 
 
     def close_all_valves(self):
-        io_port = -1
-
-        try:
-            for valve in Valves:
-                io_port = self.valvesArray[valve.value]
-                # Close
-                self.close_valve(io_port)
-        except:
-            raise Exception("Error to close valve at I/O: %d" % str(io_port))
+        # Close them all with a single call
+        self.__setValves(self._allPorts, 0, force=True)
 
 
     def close_all_chambers(self):
-        io_port = -1
-
-        try:
-            for i in range(Valves.I0.value, Valves.I2.value +1):
-                io_port = self.valvesArray[i]
-                # Open
-                self.close_valve(io_port)
-        except:
-            raise Exception("Error to close chamber's valve, I/O: %d" % str(io_port))
+        self.__setValves(self._chamberPorts, 0, force=True)
 
 
     # -------------------------------------------------------------------------
@@ -396,25 +549,21 @@ class GASS():
     # -------------------------------------------------------------------------
     def do_vacuum_all_chambers(self):
         try:
-            # Close all valves
-            self.close_all_valves()
+            with self.__valvesClosedOnExit():
+                # Close all valves
+                self.close_all_valves()
 
-            # Open valves of all chambers
-            self.open_all_chambers()
+                # Open valves of all chambers
+                self.open_all_chambers()
 
-            # Open vacuum valve
-            self.open_valve(self.valvesArray[Valves.Vacuum.value])
+                # Open vacuum valve
+                self.open_valve(self._vacuumPort)
 
-            # Wait until reach target vacuum pressure on all chambers
-            if (self.__waitAllChambersReachPressure(self.pressureVacuum)):
-                # Wait an extra-time, just for guarantee
-                sleep(self.extraTimeManifold)
-
-            # Close all valves
-            self.close_all_valves()
+                # Wait until reach target vacuum pressure on all chambers
+                if (self.__waitAllChambersReachPressure(self.pressureVacuum)):
+                    # Wait an extra-time, just for guarantee
+                    sleep(self.extraTimeManifold)
         except Exception as e:
-            # Close all valves
-            self.close_all_valves()
             # Return false
             return False, e
 
@@ -423,20 +572,16 @@ class GASS():
 
     def do_vacuum_manifold(self):
         try:
-            # Close all valves
-            self.close_all_valves()
-
-            # Open vacuum valve
-            self.open_valve(self.valvesArray[Valves.Vacuum.value])
+            with self.__valvesClosedOnExit():
+                # Close all valves
+                self.close_all_valves()
 
-            # Wait a while
-            sleep(self.extraTimeManifoldVacuum)
+                # Open vacuum valve
+                self.open_valve(self._vacuumPort)
 
-            # Close all valves
-            self.close_all_valves()
-        except:
-            # Close all valves
-            self.close_all_valves()
+                # Wait a while
+                sleep(self.extraTimeManifoldVacuum)
+        except Exception:
             # Return false
             return False
 
@@ -451,26 +596,22 @@ class GASS():
         self.close_all_valves()
 
         if (purge):
-            # In purge process, use 'N2' to clean all chambers...
-            # -----------------------------------------------------------
-            # Open 'N2' valve
-            self.open_valve(self.valvesArray[Valves.N2.value])
+            with self.__valvesClosedOnExit():
+                # In purge process, use 'N2' to clean all chambers...
+                # -----------------------------------------------------------
+                # Open 'N2' valve
+                self.open_valve(self._gasPorts[Valves.N2])
 
-            # Wait an extra-time to guarantee the manifold will be filled before to open chamber valves
-            sleep(self.extraTimeManifold)
+                # Wait an extra-time to guarantee the manifold will be filled before to open chamber valves
+                sleep(self.extraTimeManifold)
 
-            # Open all chambers valves
-            self.open_all_chambers()
+                # Open all chambers valves
+                self.open_all_chambers()
 
-            # Wait until reach target work pressure on all chambers
-            if (not self.__waitAllChambersReachPressure(self.pressureWork, greaterThan=True)):
-                # Close all valves
-                self.close_all_valves()
-                # Raise an exception
-                raise Exception("Error when purging chambers, aborting...")
-
-            # Close all valves
-            self.close_all_valves()
+                # Wait until reach target work pressure on all chambers
+                if (not self.__waitAllChambersReachPressure(self.pressureWork, greaterThan=True)):
+                    # Raise an exception
+                    raise Exception("Error when purging chambers, aborting...")
         else:
             """
             # --------------------------------------------------
@@ -487,60 +628,53 @@ class GASS():
             # Generic preparation
             # --------------------------------------------------
             updatedPressures = self.__getChambersPressures()
-            deltaPressures = []
 
             # Check pressures
             # delta = self.pressureWork - P1
-            for chamberNumber in range(3):
-                deltaPressures.append(self.pressureWork - updatedPressures[chamberNumber])
+            deltaPressures = numpy.subtract(self.pressureWork, updatedPressures)
 
             for gas in self.gases:
                 # Fill with current gas
-                self.fill_all_chambers_with_a_gas(enumGas=gas, deltaPressures=deltaPressures)
+                self.fill_all_chambers_with_a_gas(enumGas=gas, deltaPressures=deltaPressures, updatedPressures=updatedPressures)
                 # Clean manifold
                 self.do_vacuum_manifold()
+                # Pressures were changed by this gas, next one reads them again
+                updatedPressures = None
 
 
-    def fill_all_chambers_with_a_gas(self, enumGas, deltaPressures):
-        # Obtain the target pressures
-        targetPressures, updatedPressures  = self.__getTargetPressures(deltaPressures=deltaPressures, indexGas=(enumGas.value - 1))
-    
-        try:
-            print("---------------------------")
-            print("enumGas", enumGas.name)
-            print("targetPressures", targetPressures)
-            print("updatedPressures", updatedPressures)
-
-            # Open 'Gas' valve
-            self.open_valve(self.valvesArray[enumGas.value])
-
-            # Wait an extra-time to guarantee the manifold will be filled before to open chamber valves
-            sleep(self.extraTimeManifold)
-
-            # -------------------------------------------------------
-            # Check if should fill each chamber with that gas...
-            for chamberNumber in range(3):
-                # Get values
-                curPress        = updatedPressures[chamberNumber]
-                targetPress     = targetPressures[chamberNumber]
-
-                if (curPress < targetPress):
-                    # Open valve of current chamber (I0, I1 or I2)
-                    self.open_valve(self.valvesArray[Valves.I0.value + chamberNumber])
-        except:
-            # Close all valves
-            self.close_all_valves()
-            # Raise exception
-            raise Exception("Error to fill IC with gas %s, aborted!" % (enumGas.name))
+    def fill_all_chambers_with_a_gas(self, enumGas, deltaPressures, updatedPressures=None):
+        # Obtain the target pressures (chamber pressures are read only if not given)
+        targetPressures, updatedPressures  = self.__getTargetPressures(deltaPressures=deltaPressures, indexGas=(enumGas.value - 1),
+                                                                       updatedPressures=updatedPressures)
 
-        # Wait until reach target work pressure on each chamber, closing each one individually
-        if (not self.__waitEachChamberReachPressure(targetPressures, greaterThan=True)):
-            # Close all valves
-            self.close_all_valves()
-            raise Exception()
+        with self.__valvesClosedOnExit():
+            try:
+                log.debug("enumGas %s, targetPressures %s, updatedPressures %s",
+                          enumGas.name, targetPressures, updatedPressures)
 
-        # Close all valves
-        self.close_all_valves()
+                # Open 'Gas' valve
+                self.open_valve(self._gasPorts[enumGas])
+
+                # Wait an extra-time to guarantee the manifold will be filled before to open chamber valves
+                sleep(self.extraTimeManifold)
+
+                # -------------------------------------------------------
+                # Check if should fill each chamber with that gas...
+                for chamberNumber in _CHAMBERS:
+                    # Get values
+                    curPress        = updatedPressures[chamberNumber]
+                    targetPress     = targetPressures[chamberNumber]
+
+                    if (curPress < targetPress):
+                        # Open valve of current chamber (I0, I1 or I2)
+                        self.open_valve(self._chamberPorts[chamberNumber])
+            except Exception as e:
+                # Raise exception
+                raise Exception("Error to fill IC with gas %s, aborted!" % (enumGas.name)) from e
+
+            # Wait until reach target work pressure on each chamber, closing each one individually
+            if (not self.__waitEachChamberReachPressure(targetPressures, greaterThan=True)):
+                raise Exception()
 
         return True
 
@@ -559,8 +693,7 @@ class GASS():
             # Finally, do vacuum on all chambers again...
             self.do_vacuum_all_chambers()
         else:
-            # Close all valves
-            self.close_all_valves()
+            # Valves were already closed by the vacuum procedure
             #raise Exception("Impossible to purge chambers, problem when doing vacuum... %s" % str(statusExecution))
             raise Exception(str(statusExecution))
 
@@ -573,191 +706,191 @@ class GASS():
         """
         Main function to proceed with GASS operation...
         """
-        # Close all valves...
-        self.close_all_valves()
-
-        # Purge chambers...
-        self.purge_all_chambers()
+        # Close all valves at the end, even if the procedure fails
+        with self.__valvesClosedOnExit():
+            # Close all valves...
+            self.close_all_valves()
 
-        # Fill all chambers with gases depending on element and edge to work with...
-        self.fill_all_chambers()
+            # Purge chambers...
+            self.purge_all_chambers()
 
-        # Close all valves, just to be sure...
-        self.close_all_valves()
+            # Fill all chambers with gases depending on element and edge to work with...
+            self.fill_all_chambers()
 
 
     # -------------------------------------------------------------------------
     # Internal use methods
     # -------------------------------------------------------------------------
-    def __getChambersPressures(self):
-        #
-        pressures = []
-
+    @contextmanager
+    def __valvesClosedOnExit(self):
+        # All valves are closed once when the block ends, even on errors
         try:
-            #
-            i0_pressure = self.pressureI0.getPressure1()
-            pressures.append(i0_pressure)
+            yield
+        finally:
+            self.close_all_valves()
 
-            i1_pressure = self.pressureI1_I2.getPressure1()
-            pressures.append(i1_pressure)
 
-            i2_pressure = self.pressureI1_I2.getPressure2()
-            pressures.append(i2_pressure)
-        except:
-            raise Exception("Error when getting pressures...")
+    def __getChambersPressures(self):
+        # Same float64 buffer is filled on each call, callers that keep
+        # pressures across reads must copy them
+        pressures = self._chambersPressures
+        getPressure0, getPressure1, getPressure2 = self._pressureGetters
+
+        pressures[0] = getPressure0()
+        pressures[1] = getPressure1()
+        pressures[2] = getPressure2()
 
         return pressures
 
 
+    def __onPressureChange(self, value, chamberNumber, **kw):
+        # Runs on the CA thread: only the pressure is kept and the waiting
+        # thread is woken up, valves are written only by that thread
+        self._pressures[chamberNumber] = value
+        self._pressureChanged.set()
+
+
     def __getChamberPressure(self, chamberNumber):
-        pressure = None
+        # Use the monitored value, if already received
+        pressure = self._pressures[chamberNumber]
+        if (pressure is not None):
+            return pressure
 
-        # 
-        try:
-            #
-            if (chamberNumber == 0):
-                pressure = self.pressureI0.getPressure1()
-            elif (chamberNumber == 1):
-                pressure = self.pressureI1_I2.getPressure1()
-            elif (chamberNumber == 2):
-                pressure = self.pressureI1_I2.getPressure2()
-        except:
-            raise Exception("Error when getting pressure: <%d>" % (chamberNumber))
-
-        return pressure
-
-
-    def __getTargetPressures(self, deltaPressures, indexGas):
-        #
-        targetPressures = []
-        updatedPressures = self.__getChambersPressures()
-
-        if (self.get_gas_proportions().get(self.element).get(self.edge)):
-            for chamberNumber in range(3):
-                # Get values
-                curPress        = updatedPressures[chamberNumber]
-                deltaPress      = deltaPressures[chamberNumber]
-                gasProportion   = 0.01 * self.get_gas_proportions().get(self.element).get(self.edge)[chamberNumber][indexGas]
-                # --------------------------------------------------------------
-                # targetPressure = P1 + (Proportion * DeltaPressure)
-                # --------------------------------------------------------------
-                targetPressures.append(curPress + (gasProportion * deltaPress))
-        else:
-            raise Exception("Element and/or edge is not in table!")
+        return self._pressureGetters[chamberNumber]()
 
-        return targetPressures, updatedPressures
 
+    def __getMonitoredPressures(self):
+        # Pressures of all chambers, NaN while a chamber has no reading
+        pressures = self._monitoredPressures
 
-    def __waitAllChambersReachPressure(self, targetPressure, greaterThan=False):
-        print("---------------------------")
-        print("targetPressure for all chambers", targetPressure)
+        for chamberNumber in _CHAMBERS:
+            pressure = self.__getChamberPressure(chamberNumber)
+            pressures[chamberNumber] = numpy.nan if pressure is None else pressure
 
-        return self.__waitEachChamberReachPressure([targetPressure] *3, greaterThan)
+        return pressures
 
 
-    def __waitEachChamberReachPressure(self, targetPressures, greaterThan=False):
-        # Wait until reach target vacuum pressure on all chambers
-        for chamberNumber in range(3):
-            self.reachedPressure[chamberNumber] = False
+    def __getTargetPressures(self, deltaPressures, indexGas, updatedPressures=None):
+        # Read pressures, unless the caller has just read them
+        if (updatedPressures is None):
+            updatedPressures = self.__getChambersPressures()
 
-            targetPress = targetPressures[chamberNumber]
+        proportions = self._proportionMatrix
+        if (proportions is None):
+            raise Exception("Element and/or edge is not in table!")
 
-            #if (chamberNumber == 0):
-            self.enclosureQueue.put(chamberPressTask(chamberNumber))
+        # --------------------------------------------------------------
+        # targetPressure = P1 + (Proportion * DeltaPressure)
+        # --------------------------------------------------------------
+        targetPressures = _computeTargets(updatedPressures,
+                                          deltaPressures,
+                                          proportions[indexGas],
+                                          self._targetPressures)
 
-            # Start a new Thread to wait desired pressure...
-            waitPressure = Thread(target=self.__waitChamberReachPressure, args=(chamberNumber, targetPress, greaterThan))
-            waitPressure.setDaemon(True)
-            waitPressure.start()
+        return targetPressures, updatedPressures
 
-        # Wait all threads finish
-        self.enclosureQueue.join()
 
-        if (numpy.all(self.reachedPressure)):
-            # Check all pressures...
-            updatedPressures = self.__getChambersPressures()
-            print("updatedPressures at the end: ", updatedPressures)
-            # OK
-            return True
-        else:
-            # Close all valves
-            self.close_all_valves()
-            # Raise an exception
-            raise Exception("Error! Doesn't reach desired pressures!")
+    def __waitAllChambersReachPressure(self, targetPressure, greaterThan=False):
+        log.debug("targetPressure for all chambers %s", targetPressure)
 
+        # Same target for all chambers, on a reused array
+        allTargetPressures = self._allTargetPressures
+        allTargetPressures.fill(targetPressure)
 
-    def __waitChamberReachPressure(self, chamberNumber, targetPressure, greaterThan=False):
-        # Obtain a task from queue
-        chamberPressTask = self.enclosureQueue.get()
+        return self.__waitEachChamberReachPressure(allTargetPressures, greaterThan)
+
+
+    def __waitEachChamberReachPressure(self, targetPressures, greaterThan=False):
+        self.reachedPressure.fill(False)
+        closedChambers = self._closedChambers
+        closedChambers.fill(False)
+        crossedChambers = self._crossedChambers
 
         # ----------------------------------------------------------------
         # FIRST APPROACH...
         # ----------------------------------------------------------------
-        # Wait until reach target vacuum pressure on all chambers
-        waitTime = 0.05      # seconds
-        maximumLoops = MAXIMUM_TIMEOUT / waitTime
+        # Wait until reach target pressure on all chambers, checking the
+        # pressures each time a monitor is updated and closing each chamber
+        # as soon as it reaches its target
+        deadline = monotonic() + MAXIMUM_TIMEOUT
 
-        stopWaiting = False
-        tryNumber   = 0
+        while True:
+            # Cleared before reading, so an update is never missed
+            self._pressureChanged.clear()
 
-        while ((not stopWaiting) and (tryNumber < maximumLoops)):
-            # Wait a while...
-            sleep(waitTime)
+            # Check pressures
+            updatedPressures = self.__getMonitoredPressures()
+            _crossingMask(updatedPressures, targetPressures, closedChambers, greaterThan, crossedChambers)
 
-            # Check pressure
-            updatedPressure = self.__getChamberPressure(chamberNumber)
+            # -------------------------------------------------------------------
+            # If a chamber has been reached the target, close its valve
+            for chamberNumber in numpy.flatnonzero(crossedChambers):
+                self.close_valve(self._chamberPorts[chamberNumber])
+                closedChambers[chamberNumber] = True
 
-            if (updatedPressure is not None):
-                partialResult = (updatedPressure >= targetPressure) if greaterThan else (updatedPressure <= targetPressure)
-                # -------------------------------------------------------------------
-                # If this chamber has been reached the target, close its valve
-                if (partialResult):
-                    self.close_valve(self.valvesArray[Valves.I0.value + chamberNumber])
-                    stopWaiting = True
+            remaining = deadline - monotonic()
+            if (closedChambers.all() or remaining <= 0):
+                break
 
-            tryNumber += 1
+            # Wait a new pressure
+            self._pressureChanged.wait(remaining)
 
         # ----------------------------------------------------------------
         # FINE TUNING...
         # ----------------------------------------------------------------
-        # Wait until reach target vacuum pressure on all chambers
-        waitFineTuning = 1      # seconds
-        maximumLoops = MAXIMUM_TIMEOUT / waitFineTuning
-
-        stopWaiting = False
-        tryNumber   = 0
+        # Wait until reach target pressure on all chambers
+        reachedPressure = self.reachedPressure
+        deadline = monotonic() + MAXIMUM_TIMEOUT
 
         # Just for guarantee, wait a while and double check...
-        sleep(waitFineTuning)
+        sleep(FINE_TUNING_WAIT)
+        nextToggle = monotonic()
 
-        while ((not stopWaiting) and (tryNumber < maximumLoops)):
-            # Check pressure
-            updatedPressure = self.__getChamberPressure(chamberNumber)
+        while True:
+            # Cleared before reading, so an update is never missed
+            self._pressureChanged.clear()
 
-            if (updatedPressure is not None):
-                doubleCheckResult = (updatedPressure >= targetPressure) if greaterThan else (updatedPressure <= targetPressure)
+            # Check pressures; chambers that reached the target stop verification
+            updatedPressures = self.__getMonitoredPressures()
+            _crossingMask(updatedPressures, targetPressures, reachedPressure, greaterThan, crossedChambers)
+            reachedPressure |= crossedChambers
 
-                if (doubleCheckResult):
-                    # Stop verification
-                    self.reachedPressure[chamberNumber] = doubleCheckResult
-                    stopWaiting = True
-                else:
-                    # -------------------------------------------------------------------
-                    # If this chamber has not reached the target, re-open chamber just a little moment...
-                    self.__toggleValve(self.valvesArray[Valves.I0.value + chamberNumber])
+            now = monotonic()
+            if (reachedPressure.all() or now >= deadline):
+                break
 
-            tryNumber += 1
-            # Wait a while...
-            sleep(waitFineTuning)
+            # Valves are toggled at most once each FINE_TUNING_WAIT, new
+            # pressures in between are only checked
+            if (now >= nextToggle):
+                # -------------------------------------------------------------------
+                # Chambers that have not reached the target are re-opened just a little moment, all together...
+                self.__toggleValves([self._chamberPorts[chamberNumber] for chamberNumber in _CHAMBERS
+                                     if not reachedPressure[chamberNumber] and not numpy.isnan(updatedPressures[chamberNumber])])
+
+                nextToggle = monotonic() + FINE_TUNING_WAIT
+
+            # Wait a new pressure, or the next toggle
+            self._pressureChanged.wait(min(nextToggle, deadline) - monotonic())
+
+        if (numpy.all(self.reachedPressure)):
+            # Check all pressures, only read when they are logged...
+            if (log.isEnabledFor(logging.DEBUG)):
+                log.debug("updatedPressures at the end: %s", self.__getChambersPressures())
+            # OK
+            return True
+        else:
+            # Raise an exception, callers close all valves
+            raise Exception("Error! Doesn't reach desired pressures!")
 
-        # End of this thread...
-        self.enclosureQueue.task_done()
 
+    def __toggleValves(self, valves, waitTime = VALVE_TOGGLE_TIME):
+        # Valves are opened and closed together, so the wait is paid once
+        if (not valves):
+            return
 
-    def __toggleValve(self, valve, waitTime = 0.02):
-        self.open_valve(valve)
+        self.__setValves(valves, 1)
         sleep(waitTime)
-        self.close_valve(valve)
+        self.__setValves(valves, 0, force=True)
 
 
     def __getPortNumbers(self, port_sequences):
@@ -771,36 +904,11 @@ class GASS():
 
         Returns
         ----------
-        port_sequence_array : `int`
-            Array of all port numbers.
+        port_sequence_array : `tuple`
+            All port numbers.
         """
 
         try:
-            port_sequences = str(port_sequences)
-            port_sequence = port_sequences.split(';')
-            port_sequence_array = []
-
-            for p in port_sequence:
-                if len(p.split('-')) >= 1:
-                    port_init = p.split('-')[0]
-                    port_final = port_init
-                if len(p.split('-')) == 2:
-                    port_final = p.split('-')[1]
-
-                for x in range(int(port_init),int(port_final)+1):
-                    port_sequence_array.append(x)
-
-            return port_sequence_array
-
-        except:
-            raise Exception("Error when parsing digital I/O ports")
-
-
-
-"""
-Auxiliary chamberNumber class for tasks queue
-"""
-class chamberPressTask():
-    def __init__(self, number):
-        self.number = number
-
+            return _parsePortNumbers(str(port_sequences))
+        except ValueError as e:
+            raise Exception("Error when parsing digital I/O ports") from e
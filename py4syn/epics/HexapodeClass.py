@@ -10,16 +10,41 @@ Python class for Hexapode Bora controllers
                        Luciano Carneiro Guedes <luciano.guedes@lnls.br>
 
 """
+from threading import Event
 from epics import PV,Device
 from py4syn.epics.IScannable import IScannable
 from py4syn.epics.StandardDevice import StandardDevice
 
 MOVEERROR=1e-4
 
+# Number of each axis on the controller, shared by all instances
+AXES={"X":1,"Y":2,"Z":3,
+      "RX":4,"RY":5,"RZ":6}
+
+# Limits of all axes (negative and positive of X, Y, Z, RX, RY and RZ),
+# followed by the enabled limits
+LIMITATTRS=tuple('CFG#CS?:' + str(i) for i in range(1, 14))
+
 class Hexapode(IScannable,StandardDevice):
     def __init__(self, mnemonic, pvName, axis):
 
         super().__init__(mnemonic)
+        self.axis=axis
+        self.axis_dic=AXES
+        if(self.axis not in AXES):
+            raise ValueError("Invalid value for axis argument. It should be one of %s" % ", ".join(AXES))
+        self.axis_number=AXES[self.axis]
+
+        # Attribute names of this axis, built only once
+        self._posUserAttr = 'POSUSER:' + axis
+        self._posMachAttr = 'POSMACH:' + axis
+        self._negLimitAttr = 'CFG#CS?:' + str(2*self.axis_number - 1)
+        self._posLimitAttr = 'CFG#CS?:' + str(2*self.axis_number)
+        self._moveAttr = 'MOVE#PARAM:' + axis
+
+        # PVs of the axis are created with all the others, so their
+        # connections are searched at once instead of one after another
+        axisAttrs = (self._posUserAttr, self._posUserAttr + '.SCAN', self._posMachAttr)
         self.hexapode = Device(pvName + ':',('STATE#PANEL:SET','STATE#PANEL:GET',
                                 'STATE#PANEL:BUTTON','MOVE#PARAM:CM',
                                 'MOVE#PARAM:X', 'MOVE#PARAM:Y',
@@ -33,31 +58,42 @@ class Hexapode(IScannable,StandardDevice):
                                 'CFG#CS?:1', 'CFG#CS?:2', 'CFG#CS?:3',
                                 'CFG#CS?:4','CFG#CS?:5','CFG#CS?:6',
                                 'CFG#CS?:7','CFG#CS?:8','CFG#CS?:9','CFG#CS?:10',
-                                'CFG#CS?:11','CFG#CS?:12','CFG#CS?:13'))
-        self.axis=axis
-        self.axis_dic={"X":1,"Y":2,"Z":3,
-                       "RX":4,"RY":5,"RZ":6}
-        self.axis_number=self.axis_dic[self.axis]
-        self.rbv=PV(pvName + ':'+'POSUSER:'+self.axis)
-        self.pos=self.hexapode.get('POSUSER:'+self.axis)       
-        self.hexapode.add_callback('POSUSER:'+self.axis, self.onStatusChange)
-
-        self.hexapode.put('POSUSER:'+self.axis +".SCAN",9)
+                                'CFG#CS?:11','CFG#CS?:12','CFG#CS?:13') + axisAttrs)
+        self.rbv=PV(pvName + ':' + self._posUserAttr)
+        self.pos=self.hexapode.get(self._posUserAttr)
+        # Last position of the axis, updated by the monitor
+        self._readback=self.pos
+        # Axis is standing still until a move is requested; the event is
+        # set by the monitor when the target is reached
+        self.moving=False
+        self._arrived=Event()
+        self._arrived.set()
+        self.hexapode.add_callback(self._posUserAttr, self.onStatusChange)
+
+        self.hexapode.put(self._posUserAttr + ".SCAN",9)
 
     def onStatusChange(self,value,**kw):
         """
         Returns True if the target position was reached
         """
+        self._readback = value
+
         if ( abs(float(value) - float(self.pos)) >MOVEERROR):
             self.moving=True
+            self._arrived.clear()
         else:
             self.moving=False
+            self._arrived.set()
 
     def getValue(self):
         """
         Returns the current position from the axis
         """
-        return self.hexapode.get('POSUSER:'+self.axis)
+        # Monitored value, read from the IOC only while none was received
+        if (self._readback is None):
+            return self.hexapode.get(self._posUserAttr)
+
+        return self._readback
 
     def setValue(self, v):
         """
@@ -73,22 +109,32 @@ class Hexapode(IScannable,StandardDevice):
         """
         Set the target position 
         """
-        
+        # Already on target: nothing to move, and no monitor update
+        # would come to end the wait
+        if (self._readback is not None and abs(float(pos) - float(self._readback)) <= MOVEERROR):
+            self.pos=pos
+            self.moving=False
+            self._arrived.set()
+            return
+
+        # Marked as moving before the puts, so an early arrival is never missed
         self.pos=pos
-        self.hexapode.put('STATE#PANEL:SET',11)
-        self.hexapode.put('MOVE#PARAM:'+self.axis, self.pos)
         self.moving=True
+        self._arrived.clear()
+        self.hexapode.put('STATE#PANEL:SET',11)
+        self.hexapode.put(self._moveAttr, self.pos)
         self.wait()
 
     def wait(self):
-        while self.moving:
-            pass
+        # Woken by the monitor when the target is reached
+        self._arrived.wait()
 
         self.stop()
 
     def stop(self):
         self.hexapode.put('STATE#PANEL:SET',0)
         self.moving = False
+        self._arrived.set()
 
 
 #------------------------------------------------------------------------------------------
@@ -125,28 +171,17 @@ class Hexapode(IScannable,StandardDevice):
 
                 self.hexapode.put('STATE#PANEL:SET',stateValue)
                 if(axis > 0):
-                    negLim = self.hexapode.get('CFG#CS?:'+str(2*axis - 1))
-                    posLim = self.hexapode.get('CFG#CS?:'+str(2*axis))
+                    negLim, posLim = self.__getAll(LIMITATTRS[2*axis - 2:2*axis])
                     return negLim, posLim
                 else:
-                    negLimX = self.hexapode.get('CFG#CS?:1')
-                    posLimX = self.hexapode.get('CFG#CS?:2')
-                    negLimY = self.hexapode.get('CFG#CS?:3')
-                    posLimY = self.hexapode.get('CFG#CS?:4')
-                    negLimZ = self.hexapode.get('CFG#CS?:5')
-                    posLimZ = self.hexapode.get('CFG#CS?:6')
-                    negLimRX = self.hexapode.get('CFG#CS?:7')
-                    posLimRX = self.hexapode.get('CFG#CS?:8')
-                    negLimRY = self.hexapode.get('CFG#CS?:9')
-                    posLimRY = self.hexapode.get('CFG#CS?:10')
-                    negLimRZ = self.hexapode.get('CFG#CS?:11')
-                    posLimRZ = self.hexapode.get('CFG#CS?:12')
-                    enabledLimits = self.hexapode.get('CFG#CS?:13')
-
-                    return (negLimX, posLimX, negLimY, posLimY, 
-                        negLimZ, posLimZ, negLimRX, posLimRX, 
-                        negLimRY, posLimRY, negLimRZ, posLimRZ, 
-                        enabledLimits)
+                    # (negLimX, posLimX, ..., negLimRZ, posLimRZ, enabledLimits)
+                    return tuple(self.__getAll(LIMITATTRS))
+
+    def __getAll(self, attrs):
+        """
+        Read the given attributes, from the values kept by their monitors
+        """
+        return [self.hexapode.get(attr) for attr in attrs]
 
     def getLowLimitValue(self):
            if(self.axis_number < 0 or self.axis_number > 6):
@@ -156,9 +191,8 @@ class Hexapode(IScannable,StandardDevice):
                 stateValue = 33
                 self.hexapode.put('STATE#PANEL:SET',stateValue)
                 if(self.axis_number > 0):
-                    negLim = self.hexapode.get('CFG#CS?:'+str(2*self.axis_number - 1))
-                    posLim = self.hexapode.get('CFG#CS?:'+str(2*self.axis_number))
-                    return negLim #, posLim
+                    negLim = self.hexapode.get(self._negLimitAttr)
+                    return negLim
                 else:
                     print("Error getLowLimitValue")
 
@@ -170,8 +204,7 @@ class Hexapode(IScannable,StandardDevice):
                 stateValue = 33
                 self.hexapode.put('STATE#PANEL:SET',stateValue)
                 if(self.axis_number > 0):
-                    negLim = self.hexapode.get('CFG#CS?:'+str(2*self.axis_number  - 1))
-                    posLim = self.hexapode.get('CFG#CS?:'+str(2*self.axis_number ))
+                    posLim = self.hexapode.get(self._posLimitAttr)
                     return posLim
                 else:
                     print("Error getHighLimitValue")
@@ -184,7 +217,7 @@ class Hexapode(IScannable,StandardDevice):
                 stateValue = 32
                 self.hexapode.put('STATE#PANEL:SET',stateValue)
                 if(self.axis_number > 0):
-                    negLim = self.hexapode.get('CFG#CS?:'+str(2*self.axis_number - 1))
+                    negLim = self.hexapode.get(self._negLimitAttr)
                     return negLim
                 else:
                     print("Error getDialLowLimitValue")
@@ -197,7 +230,7 @@ class Hexapode(IScannable,StandardDevice):
                 stateValue = 32
                 self.hexapode.put('STATE#PANEL:SET',stateValue)
                 if(self.axis_number > 0):
-                    posLim = self.hexapode.get('CFG#CS?:'+str(2*self.axis_number ))
+                    posLim = self.hexapode.get(self._posLimitAttr)
                     return posLim
                 else:
                     print("Error getDialHLimit")
@@ -208,7 +241,7 @@ class Hexapode(IScannable,StandardDevice):
     def getRealPosition(self): 
             return self.getValue()
     def getDialRealPosition(self):
-            return self.hexapode.get('POSMACH:'+self.axis)
+            return self.hexapode.get(self._posMachAttr)
     def validateLimits(self): 
             return self.getLimits(0)
     def setRelativePosition(self,pos,waitComplete=False): 
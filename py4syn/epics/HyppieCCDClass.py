@@ -10,9 +10,14 @@ Python Class for EPICS LabView RT Detector control.
     .. note:: 25/07/2014 [douglas.beniz]  just replacing 'tabs' by 'spaces'
 """
 
-from time import sleep
+from threading import Event, Lock
+from time import monotonic
 from epics import PV
 from py4syn.epics.StandardDevice import StandardDevice
+from py4syn.utils.put import putMany
+
+# seconds to wait the IOC process a configuration and the device apply it
+ROITIMEOUT = 30
 
 class HyppieCCD(StandardDevice):
     """
@@ -38,7 +43,10 @@ class HyppieCCD(StandardDevice):
         """
 
         #print datetime.datetime.now(), " - Acquisition Done = ", (value == 0)
-        self._done = (value == 0)
+        if (value == 0):
+            self._done.set()
+        else:
+            self._done.clear()
 
 
     def onWaitChange(self, value, **kw):
@@ -55,7 +63,15 @@ class HyppieCCD(StandardDevice):
         """
 
         #print datetime.datetime.now(), " - Acquisition Done = ", (value == 0)
-        self._doneConfig = (value == 0)
+        if (value == 0):
+            # Done only when every pending configuration was acknowledged
+            with self._configLock:
+                if (self._pendingConfig > 0):
+                    self._pendingConfig -= 1
+                if (self._pendingConfig == 0):
+                    self._doneConfig.set()
+        else:
+            self._doneConfig.clear()
 
     def __init__(self, pvName, mnemonic, scalerObject=""):
         """
@@ -72,6 +88,13 @@ class HyppieCCD(StandardDevice):
         """
 
         StandardDevice.__init__(self, mnemonic)
+        # Set by the callbacks when acquisition and configuration are done,
+        # created before the PVs that call them
+        self._done = Event()
+        self._doneConfig = Event()
+        # Configurations sent together that were not acknowledged yet
+        self._configLock = Lock()
+        self._pendingConfig = 0
         self.pvAcquire = PV(pvName+":Acquire", callback=self.onAcquireChange)
         self.pvConfigWait = PV(pvName+":Wait", callback=self.onWaitChange)
         self.pvAutoIncrement = PV(pvName+":AutoIncrement")
@@ -87,8 +110,10 @@ class HyppieCCD(StandardDevice):
         self.pvCommand = PV(pvName+":StrInput")
         self.pvCommandOut = PV(pvName+":StrOutput")
         self.scaler = scalerObject
-        self._done = self.isDone()
-        self._doneConfig = self.isDoneConfig()
+        if (self.isDone()):
+            self._done.set()
+        if (self.isDoneConfig()):
+            self._doneConfig.set()
         self.time = float(self.pvAcquireTime.get()/1000000) #Convert from microsecond to second
 
     def isDone(self):
@@ -365,18 +390,23 @@ class HyppieCCD(StandardDevice):
             in the Charge-Coupled Devide (CCD)
         """
 
-        print("StX = ", startX, "SiX", sizeX, "StY", startY, "SiY", sizeY)
-        print("Set Min X")
-        self.pvMinX.put(startX)
-        print("Will Wait")
-        self.waitConfig()
-        print("Set Min Y")
-        self.pvMinY.put(startY)
-        self.waitConfig()
-        self.pvSizeX.put(sizeX)
-        self.waitConfig()
-        self.pvSizeY.put(sizeY)
-        self.waitConfig()
+        # All ROI values are sent at once, each one is acknowledged by its
+        # own configuration, so the event is set only after the last one
+        roiPVs = (self.pvMinX, self.pvMinY, self.pvSizeX, self.pvSizeY)
+        with self._configLock:
+            self._pendingConfig = len(roiPVs)
+            self._doneConfig.clear()
+
+        try:
+            deadline = monotonic() + ROITIMEOUT
+            if not putMany(roiPVs, (startX, startY, sizeX, sizeY), ROITIMEOUT):
+                raise RuntimeError("Timeout when setting the ROI of %s" % self.getMnemonic())
+
+            if not self._doneConfig.wait(max(deadline - monotonic(), 0)):
+                raise RuntimeError("Timeout when configuring the ROI of %s" % self.getMnemonic())
+        finally:
+            with self._configLock:
+                self._pendingConfig = 0
 
     def acquire(self, waitComplete=False):
         """
@@ -394,35 +424,33 @@ class HyppieCCD(StandardDevice):
         self.scaler.setCountTime(self.time)
         self.scaler.setCountStart()
 
+        # Cleared before the put, so a fast acquisition is never missed
+        self._done.clear()
         self.pvAcquire.put(1)
-        self._done = False
         if(waitComplete):
             self.wait()
         self.scaler.setCountStop()
 
     def waitConfig(self):
         """
-        Method which keeps a sleeping period meanwhile any configuration is
-        being set.
+        Method which sleeps until the configuration being set is done.
 
         Parameters
         ----------
         None
         """
 
-        self._doneConfig = False
-        while(not self._doneConfig):
-            sleep(0.001)
+        self._doneConfig.clear()
+        if not self._doneConfig.wait(ROITIMEOUT):
+            raise RuntimeError("Timeout when configuring %s" % self.getMnemonic())
 
     def wait(self):
         """
-        Method which keeps a sleeping period meanwhile any command execution is
-        being performed.
+        Method which sleeps until the command being performed is done.
 
         Parameters
         ----------
         None
         """
 
-        while(not self._done):
-            sleep(0.001)
+        self._done.wait()
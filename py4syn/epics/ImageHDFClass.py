@@ -9,27 +9,187 @@ Python Class for Save HDF images .
 .. note:: 06/02/2017 [gabrielfedel]  first version released
 """
 import os
+import re
+import json
+from threading import Thread
+from queue import Queue
+from functools import lru_cache
 
 import numpy as np
 import h5py
+# blosc filters are optional, lzf is used when they are not installed
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
 from py4syn.epics.StandardDevice import StandardDevice
 from py4syn.epics.ICountable import ICountable
 
+# spectra smaller than this are not worth compressing
+COMPRESSMINPOINTS = 512
+# how many buffered points are stored on each chunk of the points file
+POINTSCHUNK = 64
+# minimum size of the chunk cache of a compressed image file
+CHUNKCACHEMIN = 32 * 1024 * 1024
+# hash slots of the chunk cache for each chunk it can hold
+CHUNKSLOTFACTOR = 100
+# images up to this size are kept in memory and written once at the end,
+# off by default so each line reaches the file as soon as it is complete
+IMAGEMEMORY = 0
+# lines waiting to be written by the writer thread of a streamed image
+WRITEQUEUESIZE = 8
+
+# channel names are on format mcaC.Rr, ROI is optional
+CHANNELRE = re.compile(r'(\d+)(?:\.R(\d+))?$')
+
+@lru_cache(maxsize=128)
+def parseChannel(channel):
+    """Return the channel index and the ROI (None if there is no ROI) of a
+    channel name, each name is parsed only once"""
+    match = CHANNELRE.search(channel)
+    if match is None:
+        raise ValueError("Invalid channel name: %s" % channel)
+    c, r = match.groups()
+    return int(c) - 1, (None if r is None else int(r))
+
+def chunkCacheSlots(cacheBytes, chunkBytes, chunks):
+    """Return a prime number of chunk cache slots about CHUNKSLOTFACTOR
+    times the chunks that can be cached, so they rarely share a slot"""
+    cached = min(max(1, chunks), max(1, cacheBytes // max(1, chunkBytes)))
+    n = CHUNKSLOTFACTOR * cached + 1
+    while any(n % d == 0 for d in range(3, int(n ** 0.5) + 1, 2)):
+        n += 2
+    return n
+
 class ImageHDF(StandardDevice, ICountable):
     # CONSTRUCTOR OF ImageHDF CLASS
-    def __init__(self, mnemonic, numPoints, output, prefix):
+    def __init__(self, mnemonic, numPoints, output, prefix,
+                 imageMemory=IMAGEMEMORY):
         """ Constructor
         prefix: prefix for filenames
+        imageMemory: bytes an image can use to be kept in memory until it
+        is complete (0 streams every image to its file)
         """
         super().__init__(mnemonic)
 
         self.numPoints = numPoints
         self.image = None
+        self.imageNorm = None
+        self.channels = 1
+        self.ch = 0
         self.lastPos = -1
         self.output = output
         self.prefix = prefix
         self.spectrum = None
         self.fileName = ''
+        # template and next index to be used on each file name
+        self.nextIndex = {}
+
+        # when True, points are appended to a hdf file and their mca files
+        # are only written by savePoints
+        self.bufferPoints = False
+        self.pointsFile = None
+        self.pointsNames = []
+
+        # compress image datasets
+        self.compress = False
+
+        # save each channel of an image on its own dataset (data_chN and
+        # data_norm_chN), instead of a single data and data_norm
+        self.splitChannels = False
+        self.imageChannels = 1
+        self.compressed = False
+
+        # save points as raw binary files instead of mca text files
+        self.binaryOutput = False
+
+        # memory that can be used to keep a whole image, bigger images are
+        # streamed to the file line by line
+        self.imageMemory = imageMemory
+        self.inMemory = False
+
+    def searchIndex(self, start, prefix, suffix):
+        '''Search on disk the index after the last one used by a file
+        The directory is read only once, instead of checking each name'''
+        directory = os.path.dirname(start) or '.'
+        pattern = re.compile(r'%s_%s_(\d{4,})\.%s$' %
+                             (re.escape(os.path.basename(start)),
+                              re.escape(prefix), re.escape(suffix)))
+
+        idx = 0
+        try:
+            for entry in os.scandir(directory):
+                match = pattern.match(entry.name)
+                if match:
+                    idx = max(idx, int(match.group(1)) + 1)
+        except FileNotFoundError:
+            pass
+
+        return idx
+
+    def indexFile(self, start):
+        '''Name of the file that keeps the next indexes of an output'''
+        return start + '.idx'
+
+    def loadIndex(self, start, prefix, suffix, template):
+        '''Read the next index of a file name saved by a previous session
+        Returns None when there is no saved index or it is outdated'''
+        try:
+            with open(self.indexFile(start)) as f:
+                idx = json.load(f).get('%s.%s' % (prefix, suffix))
+        except (OSError, ValueError):
+            return None
+
+        # files may have been created without updating the index
+        if not isinstance(idx, int) or os.path.exists(template % idx):
+            return None
+
+        return idx
+
+    def saveIndexes(self):
+        '''Save the next index of each file name used, so the next session
+        does not need to search the directory, called once on close'''
+        indexes = {}
+        for (output, prefix, suffix), (template, idx) in \
+                self.nextIndex.items():
+            start = os.path.splitext(output)[0]
+            indexes.setdefault(start, {})['%s.%s' % (prefix, suffix)] = idx
+
+        for start, names in indexes.items():
+            fileName = self.indexFile(start)
+            # keep the indexes of names not used on this session
+            try:
+                with open(fileName) as f:
+                    saved = json.load(f)
+            except (OSError, ValueError):
+                saved = {}
+            if not isinstance(saved, dict):
+                saved = {}
+            saved.update(names)
+
+            # the index file is replaced at once, it is never left
+            # partially written
+            tmpName = fileName + '.tmp'
+            with open(tmpName, 'w') as f:
+                json.dump(saved, f)
+            os.replace(tmpName, fileName)
+
+    def nameTemplate(self, output, prefix, suffix):
+        '''Return the template and the next index of a file name
+        The template is built and the next index is read from the index
+        file, or searched on disk, only the first time a name is used'''
+        key = (output, prefix, suffix)
+        entry = self.nextIndex.get(key)
+        if entry is None:
+            start = os.path.splitext(output)[0]
+            template = '%s_%s_%%04d.%s' % (start, prefix, suffix)
+            idx = self.loadIndex(start, prefix, suffix, template)
+            if idx is None:
+                idx = self.searchIndex(start, prefix, suffix)
+            entry = [template, idx]
+            self.nextIndex[key] = entry
+
+        return entry
 
     def nameFile(self, output, prefix, suffix):
         '''Generate correct name to file
@@ -37,15 +197,79 @@ class ImageHDF(StandardDevice, ICountable):
         prefix: added after id
         suffix: extension'''
 
-        start = output.split('.')[0]
+        entry = self.nameTemplate(output, prefix, suffix)
+        resultName = entry[0] % entry[1]
+        entry[1] += 1
 
-        idx = 0
-        while os.path.exists('%s_%s_%04d.%s' % (start, prefix, idx, suffix)):
-            idx += 1
+        return resultName
 
-        resultName= '%s_%s_%04d.%s' % (start, prefix, idx, suffix)
+    def prepareNames(self, prefixes, suffix):
+        '''Search in advance the next index of each prefix, so saving a
+        point does not need to access the disk to name its file
+        prefixes: list of prefixes that will be used
+        suffix: extension'''
+        for prefix in prefixes:
+            self.nameTemplate(self.output, prefix, suffix)
 
-        return resultName
+    def pointPrefix(self):
+        '''Prefix of the files of unique points'''
+        return self.prefix
+
+    def pointName(self, suffixName=""):
+        '''Generate the name of the file of a unique point
+        suffixName: added after the point prefix'''
+        return self.nameFile(self.output, self.pointPrefix() + suffixName,
+                             self.pointSuffix())
+
+    def pointSuffix(self):
+        '''Extension of the files of unique points'''
+        if self.binaryOutput:
+            return "bin"
+        return "mca"
+
+    def writePoint(self, fileName, data):
+        '''Write a unique point on its file, as text or as raw binary'''
+        if self.binaryOutput:
+            data.tofile(fileName)
+        else:
+            np.savetxt(fileName, data, fmt='%f')
+
+    def savePoint(self, fileName, data):
+        '''Save a unique point on its file
+        If bufferPoints is set, the point is appended to a hdf file and the
+        file is only written by savePoints'''
+        if not self.bufferPoints:
+            self.writePoint(fileName, data)
+            return
+
+        if self.pointsFile is None:
+            self.pointsFile = h5py.File(
+                self.nameFile(self.output, self.prefix + '_points', "hdf"),
+                'w')
+            self.points = self.pointsFile.create_dataset(
+                'spectra',
+                shape=(0, self.numPoints),
+                maxshape=(None, self.numPoints),
+                dtype='float64',
+                chunks=(POINTSCHUNK, self.numPoints))
+
+        size = self.points.shape[0]
+        self.points.resize(size + 1, axis=0)
+        self.points[size] = data
+        self.pointsNames.append((fileName, data.dtype))
+
+    def savePoints(self):
+        '''Write the files of all buffered points'''
+        if self.pointsFile is None:
+            return
+
+        spectra = self.points[...]
+        for (fileName, dtype), data in zip(self.pointsNames, spectra):
+            self.writePoint(fileName, data.astype(dtype))
+
+        self.pointsFile.close()
+        self.pointsFile = None
+        self.pointsNames = []
 
     def saveSpectrum(self, snake = True, suffixName = ""):
         ''' save the spectrum intensity in a mca file if is a point
@@ -53,61 +277,254 @@ class ImageHDF(StandardDevice, ICountable):
             snake: if data is collected on snake mode'''
         # save a unique point
         if self.image is None:
-            self.fileName = self.nameFile(self.output, self.prefix + suffixName, "mca")
-            # TODO: change way to define fmt
-            np.savetxt(self.fileName, self.spectrum, fmt='%f')
+            self.fileName = self.pointName(suffixName)
+            self.savePoint(self.fileName, self.spectrum)
         else:
+            # each channel has its own position on the image
+            ch = self.imageChannel()
+            self.lastPos = self.channelPos[ch]
             # add a point on hdf file
-            self.col = int(self.lastPos/self.rows)
-            self.row = self.lastPos - self.rows*self.col
-            if snake:
-                # if is an odd line
-                if (self.col % 2 != 0):
-                    self.row = -1*(self.row+1)
-            self.image[self.col, self.row, :] = self.spectrum
-            self.fileResult.flush()
+            self.col, self.row = divmod(self.lastPos, self.rows)
+            # if is an odd line
+            if snake and self.col & 1:
+                self.row = -(self.row + 1)
+
+            # a new line started, the previous one goes to the file
+            if self.col != self.lineCol[ch]:
+                self.flushLine(ch)
+                self.lineCol[ch] = self.col
+
+            self.lineBuffer[ch][self.row] = self.spectrum
 
             self.lastPos += 1
+            self.channelPos[ch] = self.lastPos
+
+    def imageChannel(self):
+        '''Index of the image dataset of the current channel'''
+        if self.imageChannels == 1:
+            return 0
+        return self.ch
+
+    def flushLine(self, ch):
+        """Write the line buffered for a channel on the hdf file
+        Writing a whole line at once matches the chunks of the datasets,
+        so each chunk is written only once"""
+        col = self.lineCol[ch]
+        if self.inMemory:
+            # the image is on memory, the line is only copied to it
+            self.image[ch][col] = self.lineBuffer[ch]
+            np.multiply(self.lineBuffer[ch], self.lineNormValue[ch][:, None],
+                        out=self.imageNorm[ch][col])
+            # points not collected on a partial line must stay empty
+            self.lineBuffer[ch].fill(0)
+        else:
+            # the whole line is normalized at once
+            line = self.lineBuffer[ch]
+            lineNorm = np.multiply(line, self.lineNormValue[ch][:, None],
+                                   dtype='float32')
+
+            # the line is handed to the writer thread, blocking only when
+            # the writer is too far behind
+            self.lineQueue.put((ch, col, line, lineNorm))
+            self.lineBuffer[ch] = np.zeros_like(line)
+
+        self.lineNormValue[ch].fill(0)
 
-    def startCollectImage(self, dtype, rows=0, cols=0):
+    def writeLines(self):
+        """Write on the hdf file the lines queued by flushLine, runs on its
+        own thread so acquisition does not wait for the disk"""
+        while True:
+            item = self.lineQueue.get()
+            if item is None:
+                break
+            # after an error the remaining lines are only discarded
+            if self.writeError is not None:
+                continue
+
+            ch, col, line, lineNorm = item
+            try:
+                self.writeLine(self.image[ch], col, line)
+                self.writeLine(self.imageNorm[ch], col, lineNorm)
+                self.fileResult.flush()
+            except Exception as e:
+                self.writeError = e
+
+    def writeLine(self, dataset, col, data):
+        """Write a line on a dataset
+        A line is exactly a chunk, so when there is no filter it is written
+        directly, without passing through the hdf filter pipeline"""
+        if not self.compressed:
+            dataset.id.write_direct_chunk((col, 0, 0), data.tobytes())
+        else:
+            dataset[col] = data
+
+    def datasetNames(self, c):
+        """Names of the data and normalized datasets of a channel"""
+        if self.imageChannels == 1:
+            return 'data', 'data_norm'
+        return 'data_ch%d' % c, 'data_norm_ch%d' % c
+
+    def filters(self):
+        """Filters of the image datasets"""
+        if not self.compressed:
+            # no filter at all, so lines can be written directly
+            return {'shuffle': False, 'fletcher32': False}
+
+        # spectra are mostly zero on the tails, lz4 and lzf are cheap
+        # enough to keep up with the acquisition
+        if hdf5plugin is not None:
+            return dict(hdf5plugin.Blosc(cname='lz4', clevel=1,
+                                         shuffle=hdf5plugin.Blosc.SHUFFLE))
+        return {'compression': 'lzf', 'shuffle': True}
+
+    def startCollectImage(self, dtype, rows=0, cols=0, channels=1):
         """Start to collect an image
-        When collect an image, the points will be  saved on a hdf file"""
+        When collect an image, the points will be  saved on a hdf file
+        channels: number of channels, each one is saved on its own dataset
+        when splitChannels is set"""
         self.rows = rows
         self.cols = cols
-        # create HDF file
-        self.fileName = self.nameFile(self.output, self.prefix, "hdf")
-        self.fileResult = h5py.File(self.fileName)
+        self.channels = channels
+        self.imageChannels = channels if self.splitChannels else 1
+
+        lineBytes = self.rows * self.numPoints * \
+            max(np.dtype(dtype).itemsize, np.dtype('float32').itemsize)
 
-        # TODO: review this
+        self.compressed = self.compress and \
+            self.numPoints >= COMPRESSMINPOINTS
+
+        # uncompressed lines are written directly, bypassing the chunk
+        # cache, so only compressed datasets need a bigger one; it must
+        # hold some lines so a chunk is never evicted while being written,
+        # and rdcc_w0=1 evicts first the chunks already fully written
+        cache = {}
+        if self.compressed:
+            cacheBytes = max(CHUNKCACHEMIN, 4 * lineBytes)
+            cache = {'rdcc_nbytes': cacheBytes,
+                     'rdcc_nslots': chunkCacheSlots(cacheBytes, lineBytes,
+                                                    self.cols),
+                     'rdcc_w0': 1.0}
+
+        # create HDF file, the file is created only if the name is free
+        # and the next index is tried otherwise
+        while True:
+            self.fileName = self.nameFile(self.output, self.prefix, "hdf")
+            try:
+                self.fileResult = h5py.File(self.fileName, 'x', **cache)
+                break
+            except OSError:
+                if not os.path.exists(self.fileName):
+                    raise
+
+        # lines are written at once, so a chunk holds a whole line
         lineShape = (1, self.rows, self.numPoints)
-        self.image = self.fileResult.create_dataset(
-                     'data',
-                     shape=(self.cols, self.rows, self.numPoints),
-                     dtype=dtype,
-                     chunks=lineShape)
-
-        # create "image" normalized
-        self.imageNorm = self.fileResult.create_dataset(
-                     'data_norm',
-                     shape=(self.cols, self.rows, self.numPoints),
-                     dtype='float32',
-                     chunks=lineShape)
-
-        # last collected point
+        imageShape = (self.cols, self.rows, self.numPoints)
+
+        # small images are kept in memory and each dataset is written with
+        # a single call on stopCollectImage
+        self.inMemory = self.cols * lineBytes * 2 * self.imageChannels <= \
+            self.imageMemory
+
+        # with splitChannels there is one dataset per channel, so a channel
+        # can be read without touching the others
+        self.image = []
+        self.imageNorm = []
+        self.lineBuffer = []
+        self.lineNormValue = []
+        for c in range(self.imageChannels):
+            if self.inMemory:
+                self.image.append(np.zeros(imageShape, dtype=dtype))
+                self.imageNorm.append(np.zeros(imageShape, dtype='float32'))
+            else:
+                dataName, normName = self.datasetNames(c)
+                self.image.append(self.fileResult.create_dataset(
+                             dataName,
+                             shape=imageShape,
+                             dtype=dtype,
+                             chunks=lineShape,
+                             track_times=False,
+                             **self.filters()))
+
+                # create "image" normalized
+                self.imageNorm.append(self.fileResult.create_dataset(
+                             normName,
+                             shape=imageShape,
+                             dtype='float32',
+                             chunks=lineShape,
+                             track_times=False,
+                             **self.filters()))
+
+            # points are kept in memory until their line is complete
+            self.lineBuffer.append(np.zeros((self.rows, self.numPoints),
+                                            dtype=dtype))
+            self.lineNormValue.append(np.zeros(self.rows, dtype='float32'))
+
+        # last collected point and line on buffer of each channel
+        self.channelPos = [0] * self.imageChannels
+        self.lineCol = [0] * self.imageChannels
         self.lastPos = 0
 
+        # streamed lines are written by a background thread
+        self.writeError = None
+        if not self.inMemory:
+            self.lineQueue = Queue(maxsize=WRITEQUEUESIZE)
+            self.writer = Thread(target=self.writeLines, daemon=True)
+            self.writer.start()
+
     def stopCollectImage(self):
         """Stop collect image"""
+        # write the lines still on buffer
+        for c in range(self.imageChannels):
+            if self.channelPos[c] > self.lineCol[c] * self.rows:
+                self.flushLine(c)
+
+        if self.inMemory:
+            # without filters the datasets are contiguous, so each one is
+            # a single write
+            filters = self.filters()
+            chunks = (1, self.rows, self.numPoints) if self.compressed \
+                else None
+            for c in range(self.imageChannels):
+                dataName, normName = self.datasetNames(c)
+                self.fileResult.create_dataset(dataName, data=self.image[c],
+                                               chunks=chunks,
+                                               track_times=False, **filters)
+                self.fileResult.create_dataset(normName,
+                                               data=self.imageNorm[c],
+                                               chunks=chunks,
+                                               track_times=False, **filters)
+
+        else:
+            # wait the writer thread finish the queued lines
+            self.lineQueue.put(None)
+            self.writer.join()
+
         self.fileResult.close()
+        self.image = None
+        self.imageNorm = None
         self.lastPos = -1
 
+        if self.writeError is not None:
+            raise self.writeError
+
+    def closeImage(self):
+        """Write and close the image being collected, if any, so a scan
+        that is aborted keeps the points already collected"""
+        if self.image is not None:
+            self.stopCollectImage()
+
     def setNormValue(self, value):
         """Applies normalization"""
-        result = np.multiply(self.spectrum, float(value))
         if self.image is None:
             # normalization for a point
-            fileName = self.nameFile(self.output, self.prefix + '_norm', "mca")
-            np.savetxt(fileName, result, fmt='%f')
+            result = np.multiply(self.spectrum, float(value))
+            fileName = self.pointName('_norm')
+            self.savePoint(fileName, result)
 
         else:
-            self.imageNorm[self.col, self.row, :] = result
+            # image points are normalized when their line is written, the
+            # value applies to every channel already saved on this point
+            pos = self.channelPos[self.imageChannel()]
+            for c in range(self.imageChannels):
+                if self.channelPos[c] == pos:
+                    self.lineNormValue[c][self.row] = value
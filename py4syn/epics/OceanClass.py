@@ -17,18 +17,18 @@ import numpy as np
 from epics import PV
 from threading import Event
 from py4syn.utils.timer import Timer
-from py4syn.epics.ImageHDFClass import ImageHDF
+from py4syn.epics.ImageHDFClass import ImageHDF, IMAGEMEMORY
 
 
 class OceanOpticsSpectrometer(ImageHDF):
     # CONSTRUCTOR OF Ocean CLASS
     def __init__(self, mnemonic, pv=None, responseTimeout=15, output="./out",
-                 numPoints=1044, mcas=False):
+                 numPoints=1044, mcas=False, imageMemory=IMAGEMEMORY):
         """Constructor
         responseTimeout : how much time to wait qe65000 answer
         numPoints : how many points are collected each time
         """
-        super().__init__(mnemonic, numPoints, output, 'ocean')
+        super().__init__(mnemonic, numPoints, output, 'ocean', imageMemory)
         self.acquireChanged = Event()
         self.acquiring = False
 
@@ -113,6 +113,8 @@ class OceanOpticsSpectrometer(ImageHDF):
 
     def close(self):
         self.setCountStop()
+        self.closeImage()
+        self.saveIndexes()
 
     def saveUniquePoint(self, data, fmt, suffixName = ""):
         self.mcaFile = super().nameFile(self.output, self.prefix + suffixName, "mca")
@@ -0,0 +1,40 @@
+from threading import Event, Lock
+
+def putMany(pvs, values, timeout):
+    """
+    Writes a value to each PV and waits until all puts complete. All puts
+    are sent before waiting, so they are completed together. The wait sleeps
+    on an event set by the put callbacks, it does not poll.
+
+    Parameters
+    ----------
+    pvs : `list`
+        PVs to be written
+    values : `list`
+        Values of the PVs, in the same order of the PVs
+    timeout : `float`
+        Maximum time (seconds) to wait all puts
+
+    Returns
+    -------
+    `bool`
+        True if all puts completed, False on timeout
+    """
+    puts = list(zip(pvs, values))
+    if not puts:
+        return True
+
+    done = Event()
+    lock = Lock()
+    pending = [len(puts)]
+
+    def onComplete(**kw):
+        with lock:
+            pending[0] -= 1
+            if pending[0] == 0:
+                done.set()
+
+    for pv, value in puts:
+        pv.put(value, use_complete=True, callback=onComplete)
+
+    return done.wait(timeout)
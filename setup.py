@@ -18,10 +18,10 @@ setup(
     long_description=readme,
     install_requires=[
         "versioneer>=0.16",
-        "numpy>=1.8.1",
+        "numpy>=1.17",
         "matplotlib>=1.3.0",
         "pyepics>=3.2.0",
-        "h5py>=2.3",
+        "h5py>=2.9",
         "lmfit>=0.8.3"
     ],
     zip_safe=False,
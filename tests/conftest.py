@@ -0,0 +1,19 @@
+"""Fixtures shared by the tests of the ImageHDF devices"""
+import pytest
+
+
+@pytest.fixture
+def makeImage(tmp_path):
+    """Factory of ImageHDF devices with the file state of ImageHDF only, no
+    PV is created and points are saved on tmp_path"""
+    ImageHDF = pytest.importorskip("py4syn.epics.ImageHDFClass").ImageHDF
+
+    def make(cls, prefix="custom", numPoints=8, **attrs):
+        image = cls.__new__(cls)
+        ImageHDF.__init__(image, "img", numPoints, str(tmp_path / "scan.txt"),
+                          prefix)
+        for name, value in attrs.items():
+            setattr(image, name, value)
+        return image
+
+    return make
@@ -0,0 +1,25 @@
+"""Tests of the point files saved by the Dxp class"""
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("h5py")
+pytest.importorskip("epics")
+
+from py4syn.epics.DxpClass import Dxp
+from py4syn.epics.ImageHDFClass import ImageHDF
+
+
+def testSetNormValueKeepsPrefix(tmp_path, makeImage):
+    dxp = makeImage(Dxp, dxpType="mca")
+
+    for i in range(2):
+        dxp.spectrum = np.arange(8, dtype='int32')
+        ImageHDF.saveSpectrum(dxp)
+        dxp.setNormValue(2.0)
+
+    assert dxp.prefix == "custom"
+    for i in range(2):
+        assert os.path.exists(str(tmp_path / ("scan_mca0_%04d.mca" % i)))
+        assert os.path.exists(str(tmp_path / ("scan_mca0_norm_%04d.mca" % i)))
@@ -0,0 +1,118 @@
+"""Tests of the point and image files saved by the ImageHDF class"""
+import pytest
+
+np = pytest.importorskip("numpy")
+h5py = pytest.importorskip("h5py")
+
+from py4syn.epics.DxpFakeClass import DxpFake
+from py4syn.epics.ImageHDFClass import ImageHDF, COMPRESSMINPOINTS
+
+ROWS = 3
+COLS = 4
+
+
+def spectrum(point, ch=0, numPoints=COMPRESSMINPOINTS):
+    """Spectrum that identifies its point and channel"""
+    return np.full(numPoints, 10 * point + ch + 1, dtype='int32')
+
+
+def collect(image, points, channels=1):
+    """Save the first points of a ROWS x COLS image, normalizing each one by
+    its index + 1, and return the datasets of the image file"""
+    ImageHDF.startCollectImage(image, 'int32', ROWS, COLS, channels)
+    for point in range(points):
+        for ch in range(channels):
+            image.ch = ch
+            image.spectrum = spectrum(point, ch)
+            ImageHDF.saveSpectrum(image)
+        image.setNormValue(point + 1)
+    image.closeImage()
+
+    with h5py.File(image.fileName, 'r') as f:
+        return {name: f[name][...] for name in f}
+
+
+def expected(points, ch=0):
+    """Data and normalized data of the first points of a snake image"""
+    data = np.zeros((COLS, ROWS, COMPRESSMINPOINTS), dtype='int32')
+    norm = np.zeros(data.shape, dtype='float32')
+    for point in range(points):
+        col, row = divmod(point, ROWS)
+        if col & 1:
+            row = -(row + 1)
+        data[col, row] = spectrum(point, ch)
+        norm[col, row] = spectrum(point, ch) * (point + 1)
+    return data, norm
+
+
+def testPointNormValue(tmp_path, makeImage):
+    image = makeImage(DxpFake)
+    image.spectrum = np.arange(8, dtype='int32')
+    ImageHDF.saveSpectrum(image)
+    image.setNormValue(2.0)
+
+    assert np.array_equal(np.loadtxt(str(tmp_path / "scan_custom_0000.mca")),
+                          np.arange(8))
+    assert np.array_equal(
+        np.loadtxt(str(tmp_path / "scan_custom_norm_0000.mca")),
+        2 * np.arange(8))
+
+
+@pytest.mark.parametrize("imageMemory", [0, 1 << 30])
+@pytest.mark.parametrize("compress", [False, True])
+def testImageIsWrittenInSnakeOrder(makeImage, imageMemory, compress):
+    image = makeImage(DxpFake, numPoints=COMPRESSMINPOINTS,
+                      imageMemory=imageMemory, compress=compress)
+    datasets = collect(image, ROWS * COLS)
+
+    assert image.inMemory == bool(imageMemory)
+    assert image.compressed == compress
+    assert sorted(datasets) == ['data', 'data_norm']
+    data, norm = expected(ROWS * COLS)
+    assert np.array_equal(datasets['data'], data)
+    assert np.array_equal(datasets['data_norm'], norm)
+
+
+@pytest.mark.parametrize("imageMemory", [0, 1 << 30])
+def testCloseImageKeepsPartialImage(makeImage, imageMemory):
+    image = makeImage(DxpFake, numPoints=COMPRESSMINPOINTS,
+                      imageMemory=imageMemory)
+    # the last line is incomplete and is written only by closeImage
+    datasets = collect(image, ROWS * COLS - 2)
+
+    assert image.image is None
+    data, norm = expected(ROWS * COLS - 2)
+    assert np.array_equal(datasets['data'], data)
+    assert np.array_equal(datasets['data_norm'], norm)
+
+
+def testSplitChannelsNormalizesEveryChannel(makeImage):
+    image = makeImage(DxpFake, numPoints=COMPRESSMINPOINTS,
+                      splitChannels=True)
+    datasets = collect(image, ROWS * COLS, channels=2)
+
+    assert sorted(datasets) == ['data_ch0', 'data_ch1',
+                                'data_norm_ch0', 'data_norm_ch1']
+    for ch in range(2):
+        data, norm = expected(ROWS * COLS, ch)
+        assert np.array_equal(datasets['data_ch%d' % ch], data)
+        assert np.array_equal(datasets['data_norm_ch%d' % ch], norm)
+
+
+def testChannelsShareDatasetByDefault(makeImage):
+    image = makeImage(DxpFake, numPoints=COMPRESSMINPOINTS)
+    datasets = collect(image, 0, channels=2)
+
+    assert sorted(datasets) == ['data', 'data_norm']
+
+
+def testSavedIndexIsUsedByNextSession(tmp_path, makeImage):
+    output = str(tmp_path / "scan.txt")
+    image = makeImage(DxpFake)
+    assert image.nameFile(output, "mca0", "mca").endswith("scan_mca0_0000.mca")
+    assert image.nameFile(output, "mca0", "mca").endswith("scan_mca0_0001.mca")
+    image.saveIndexes()
+
+    # no file was written, so only the index file knows the next index
+    image = makeImage(DxpFake)
+    assert image.nameFile(output, "mca0", "mca").endswith("scan_mca0_0002.mca")